@@ -0,0 +1,184 @@
+from typing import Dict, List, Optional
+
+from aws_cdk import (
+    aws_ecs as ecs,
+    aws_logs,
+    aws_cloudwatch as cloudwatch,
+    aws_applicationautoscaling as autoscaling,
+    aws_iam as iam,
+    Duration,
+    RemovalPolicy,
+    Stack,
+)
+from constructs import Construct
+
+
+# Helpers shared by the selenium services (ecs.py) and the team pools (team_pools.py).
+
+
+def create_fargate_task_definition(
+    scope: Construct,
+    id: str,
+    container_id: str,
+    image: str,
+    cpu: int,
+    memory: int,
+    log_group_id: str,
+    log_group_name: str,
+    stream_prefix: str,
+    ports: List[int],
+    environment: Dict[str, str] = None,
+    shm: bool = True,
+) -> ecs.FargateTaskDefinition:
+    task_definition = ecs.FargateTaskDefinition(
+        scope,
+        id,
+        memory_limit_mib=memory,
+        cpu=cpu,
+    )
+
+    container = task_definition.add_container(
+        container_id,
+        image=ecs.ContainerImage.from_registry(name=image),
+        environment=environment,
+        logging=ecs.LogDriver.aws_logs(
+            stream_prefix=stream_prefix,
+            log_group=aws_logs.LogGroup(
+                scope,
+                log_group_id,
+                log_group_name=log_group_name,
+                retention=aws_logs.RetentionDays.ONE_WEEK,
+                removal_policy=RemovalPolicy.DESTROY,
+            ),
+        ),
+    )
+    if shm:
+        # Fargate caps /dev/shm at 64MB which crashes Chrome, back it with task storage.
+        task_definition.add_volume(name="shm")
+        container.add_mount_points(
+            ecs.MountPoint(
+                container_path="/dev/shm", source_volume="shm", read_only=False
+            )
+        )
+    for port in ports:
+        container.add_port_mappings(ecs.PortMapping(container_port=port))
+
+    return task_definition
+
+
+def fargate_capacity(pool: Dict) -> List[ecs.CapacityProviderStrategy]:
+    # Split of a pool between FARGATE_SPOT and FARGATE, from its stage config.
+    return [
+        ecs.CapacityProviderStrategy(
+            capacity_provider="FARGATE_SPOT",
+            weight=pool["fargate_spot"]["weight"],
+            base=pool["fargate_spot"]["base"],
+        ),
+        ecs.CapacityProviderStrategy(
+            capacity_provider="FARGATE",
+            weight=pool["fargate"]["weight"],
+            base=pool["fargate"]["base"],
+        ),
+    ]
+
+
+def service_scalable_target(
+    scope: Construct,
+    id: str,
+    cluster: ecs.ICluster,
+    service: ecs.BaseService,
+    min_capacity: int,
+    max_capacity: int,
+) -> autoscaling.ScalableTarget:
+    return autoscaling.ScalableTarget(
+        scope,
+        id,
+        # The service-linked role Application Auto Scaling creates for ECS, instead of a
+        # role per scalable target.
+        role=iam.Role.from_role_arn(
+            scope,
+            id + "Role",
+            Stack.of(scope).format_arn(
+                service="iam",
+                region="",
+                resource="role",
+                resource_name="aws-service-role/ecs.application-autoscaling.amazonaws.com/"
+                "AWSServiceRoleForApplicationAutoScaling_ECSService",
+            ),
+        ),
+        service_namespace=autoscaling.ServiceNamespace.ECS,
+        resource_id=f"service/{cluster.cluster_name}/{service.service_name}",
+        scalable_dimension="ecs:service:DesiredCount",
+        min_capacity=min_capacity,
+        max_capacity=max_capacity,
+    )
+
+
+def service_metric(
+    cluster: ecs.ICluster, service: ecs.BaseService, namespace: str, metric_name: str, **kwargs
+) -> cloudwatch.Metric:
+    return cloudwatch.Metric(
+        namespace=namespace,
+        metric_name=metric_name,
+        dimensions_map={
+            "ClusterName": cluster.cluster_name,
+            "ServiceName": service.service_name,
+        },
+        **kwargs,
+    )
+
+
+def scale_on_cpu(
+    scope: Construct,
+    id: str,
+    policy_id: str,
+    cluster: ecs.ICluster,
+    service: ecs.BaseService,
+    min_capacity: int,
+    max_capacity: int,
+) -> autoscaling.ScalableTarget:
+    scaling = service_scalable_target(
+        scope, id, cluster, service, min_capacity, max_capacity
+    )
+
+    scaling.scale_on_metric(
+        policy_id,
+        metric=service_metric(cluster, service, "AWS/ECS", "CPUUtilization"),
+        scaling_steps=[
+            autoscaling.ScalingInterval(change=-1, lower=10),
+            autoscaling.ScalingInterval(change=+1, lower=50),
+            autoscaling.ScalingInterval(change=+3, lower=70),
+        ],
+        evaluation_periods=10,
+        datapoints_to_alarm=6,
+    )
+    return scaling
+
+
+def scale_in_when_idle(
+    scaling: autoscaling.ScalableTarget,
+    policy_id: str,
+    cluster: ecs.ICluster,
+    service: ecs.BaseService,
+    demand: Optional[cloudwatch.IMetric] = None,
+) -> None:
+    # Removes a task once the service CPU stayed idle, and never while `demand` is above 0:
+    # a service only gives back its own idle tasks instead of reacting to another pool.
+    cpu = service_metric(cluster, service, "AWS/ECS", "CPUUtilization")
+    idle = cpu
+    if demand is not None:
+        idle = cloudwatch.MathExpression(
+            expression="IF(FILL(demand, 0) > 0, 100, FILL(cpu, 0))",
+            using_metrics={"demand": demand, "cpu": cpu},
+            period=Duration.minutes(1),
+        )
+    scaling.scale_on_metric(
+        policy_id,
+        metric=idle,
+        scaling_steps=[
+            autoscaling.ScalingInterval(change=-1, upper=10),
+            autoscaling.ScalingInterval(change=0, lower=10),
+        ],
+        evaluation_periods=10,
+        datapoints_to_alarm=6,
+    )
@@ -3,6 +3,7 @@ from typing import Dict
 from aws_cdk import aws_ec2 as ec2, Stack
 from utils.stack_util import add_tags_to_stack
 from .ecs import Ecs
+from .team_pools import TeamPools, dedicated_teams
 from constructs import Construct
 
 
@@ -16,3 +17,8 @@ class ComputeStack(Stack):
         add_tags_to_stack(self, config)
         # create the ecs cluster
         self._ecs = Ecs(self, "Ecs", config, vpc)
+        # create the dedicated pools of the teams that don't share the grid
+        if dedicated_teams(config):
+            self._team_pools = TeamPools(
+                self, "TeamPools", config, self._ecs._cluster, vpc
+            )
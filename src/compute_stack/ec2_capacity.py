@@ -0,0 +1,205 @@
+from typing import Dict
+
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_iam as iam,
+    aws_autoscaling as autoscaling,
+)
+from constructs import Construct
+
+
+# Task ENIs an instance can attach in awsvpc mode: (without, with) the awsvpcTrunking
+# account setting. Without trunking the primary ENI is taken by the instance itself.
+TASK_ENIS = {
+    "m5.2xlarge": (3, 40),
+    "m5a.2xlarge": (3, 40),
+    "m6i.2xlarge": (3, 40),
+    "m5.4xlarge": (7, 60),
+    "m5a.4xlarge": (7, 60),
+    "m6i.4xlarge": (7, 60),
+}
+
+
+DEFAULT_SUBNET_GROUP_NAME = "Private"
+
+
+def ec2_enabled(config: Dict) -> bool:
+    return bool((config["compute"]["ecs"].get("ec2") or {}).get("enabled"))
+
+
+def ec2_subnet_group_name(config: Dict) -> str:
+    return config["compute"]["ecs"]["ec2"].get(
+        "subnet_group_name", DEFAULT_SUBNET_GROUP_NAME
+    )
+
+
+def baseline_task_count(config: Dict) -> int:
+    # EC2 baseline tasks of all the selenium services at their maximum.
+    selenium = config["compute"]["ecs"]["selenium"]
+    if "ec2_baseline" not in selenium:
+        return 0
+    return selenium.get("service_count", 1) * selenium["ec2_baseline"]["maximum_containers"]
+
+
+class Ec2Capacity(Construct):
+    """ASG backed capacity provider for the EC2 baseline of the browser pools.
+
+    Large instances keep the browser image cached and take many tasks each, which
+    is cheaper than Fargate for the load that is there all day. The ASG mixes
+    on-demand and spot instances, is scaled by ECS managed scaling and keeps
+    stopped instances in a warm pool so a scale-out doesn't wait for a boot and
+    an image pull. Tasks use awsvpc, which can't get a public IP on EC2, so the
+    instances must live in a private subnet group with a NAT gateway. Each task
+    takes an ENI, so without the awsvpcTrunking account setting an instance only
+    fits a few tasks: the ASG must be able to place every baseline task at its
+    maximum, which is checked at synth time.
+    """
+
+    _config: Dict
+    capacity_provider: ecs.AsgCapacityProvider
+    security_group: ec2.SecurityGroup
+    vpc_subnets: ec2.SubnetSelection
+
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        config: Dict,
+        cluster: ecs.Cluster,
+        vpc: ec2.IVpc,
+    ) -> None:
+        super().__init__(scope, id)
+        self._config = config
+        ec2_config = config["compute"]["ecs"]["ec2"]
+
+        subnet_group_name = ec2_subnet_group_name(config)
+        self.__validate_subnet_group(subnet_group_name)
+        self.__validate_task_capacity()
+        self.vpc_subnets = ec2.SubnetSelection(subnet_group_name=subnet_group_name)
+
+        self.security_group = ec2.SecurityGroup(
+            self,
+            "SecurityGroup",
+            vpc=vpc,
+            allow_all_outbound=True,
+        )
+        instance_types = ec2_config["instance_types"]
+        launch_template = ec2.LaunchTemplate(
+            self,
+            "LaunchTemplate",
+            instance_type=ec2.InstanceType(instance_types[0]),
+            machine_image=ecs.EcsOptimizedImage.amazon_linux2(),
+            role=iam.Role(
+                self,
+                "InstanceRole",
+                assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"),
+            ),
+            security_group=self.security_group,
+            # The cluster adds the ECS agent configuration to it.
+            user_data=ec2.UserData.for_linux(),
+        )
+
+        auto_scaling_group = autoscaling.AutoScalingGroup(
+            self,
+            "Asg",
+            vpc=vpc,
+            vpc_subnets=self.vpc_subnets,
+            min_capacity=ec2_config.get("min_capacity", 0),
+            max_capacity=ec2_config["max_capacity"],
+            mixed_instances_policy=autoscaling.MixedInstancesPolicy(
+                launch_template=launch_template,
+                launch_template_overrides=[
+                    autoscaling.LaunchTemplateOverrides(
+                        instance_type=ec2.InstanceType(instance_type)
+                    )
+                    for instance_type in instance_types
+                ],
+                instances_distribution=autoscaling.InstancesDistribution(
+                    on_demand_base_capacity=ec2_config.get("on_demand_base_capacity", 0),
+                    on_demand_percentage_above_base_capacity=ec2_config.get(
+                        "on_demand_percentage_above_base", 0
+                    ),
+                    spot_allocation_strategy=autoscaling.SpotAllocationStrategy[
+                        ec2_config.get("spot_allocation_strategy", "CAPACITY_OPTIMIZED")
+                    ],
+                ),
+            ),
+        )
+
+        warm_pool = ec2_config.get("warm_pool")
+        if warm_pool:
+            auto_scaling_group.add_warm_pool(
+                min_size=warm_pool.get("min_size", 0),
+                pool_state=autoscaling.PoolState[warm_pool.get("pool_state", "STOPPED")],
+            )
+
+        self.capacity_provider = ecs.AsgCapacityProvider(
+            self,
+            "CapacityProvider",
+            auto_scaling_group=auto_scaling_group,
+            enable_managed_scaling=True,
+            enable_managed_termination_protection=True,
+            target_capacity_percent=ec2_config.get("target_capacity_percent", 100),
+        )
+        cluster.add_asg_capacity_provider(self.capacity_provider)
+        # Drain the tasks of a spot instance as soon as its interruption notice arrives.
+        # Set here because the cluster only adds it for ASGs with a spotPrice, which a
+        # mixed instances policy doesn't have.
+        auto_scaling_group.add_user_data(
+            "echo ECS_ENABLE_SPOT_INSTANCE_DRAINING=true >> /etc/ecs/ecs.config"
+        )
+        # The agent sets its instance to DRAINING itself, the cluster policy doesn't allow it.
+        auto_scaling_group.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=["ecs:UpdateContainerInstancesState"],
+                resources=["*"],
+                conditions={"ArnEquals": {"ecs:cluster": cluster.cluster_arn}},
+            )
+        )
+        if warm_pool:
+            # Keep the agent from registering instances while they sit in the warm pool.
+            auto_scaling_group.add_user_data(
+                "echo ECS_WARM_POOLS_CHECK=true >> /etc/ecs/ecs.config"
+            )
+
+    def __validate_subnet_group(self, subnet_group_name: str) -> None:
+        network = self._config["network"]
+        subnet = next(
+            (s for s in network["subnets"] if s["name"] == subnet_group_name), None
+        )
+        if subnet is None or subnet["subnetType"] not in [
+            "PRIVATE_WITH_EGRESS",
+            "PRIVATE_WITH_NAT",
+        ]:
+            raise ValueError(
+                f"EC2 capacity needs a private subnet group named '{subnet_group_name}' "
+                "with egress, awsvpc tasks on EC2 have no public IP."
+            )
+        if network["vpc"]["create_natgateway"] != 1:
+            raise ValueError("EC2 capacity needs network.vpc.create_natgateway: 1.")
+
+    def __validate_task_capacity(self) -> None:
+        ec2_config = self._config["compute"]["ecs"]["ec2"]
+        needed = baseline_task_count(self._config)
+        if not needed:
+            return
+
+        trunking = ec2_config.get("awsvpc_trunking", False)
+        unknown = [t for t in ec2_config["instance_types"] if t not in TASK_ENIS]
+        if unknown:
+            raise ValueError(
+                f"Unknown task ENI limit for {unknown}, add them to TASK_ENIS."
+            )
+        # The ASG may launch any of the instance types, plan for the smallest.
+        tasks_per_instance = min(
+            TASK_ENIS[t][1 if trunking else 0] for t in ec2_config["instance_types"]
+        )
+        capacity = tasks_per_instance * ec2_config["max_capacity"]
+        if capacity < needed:
+            raise ValueError(
+                f"EC2 capacity fits {capacity} awsvpc tasks ({tasks_per_instance} per "
+                f"instance, max_capacity {ec2_config['max_capacity']}) but the baselines "
+                f"need {needed}. Raise max_capacity, lower ec2_baseline."
+                "maximum_containers or enable awsvpc_trunking on the account."
+            )
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 
 from aws_cdk import (
     aws_ec2 as ec2,
@@ -6,18 +6,31 @@ from aws_cdk import (
     aws_ecr as ecr,
     aws_logs,
     aws_cloudwatch as cloudwatch,
+    aws_applicationautoscaling as autoscaling,
     Duration,
     aws_elasticloadbalancingv2 as elbv2,
-    aws_applicationautoscaling as autoscaling,
     RemovalPolicy,
 )
 from constructs import Construct
 
+from .browser import (
+    create_fargate_task_definition,
+    fargate_capacity,
+    scale_in_when_idle,
+    scale_on_cpu,
+    service_metric,
+    service_scalable_target,
+)
+from .ec2_capacity import Ec2Capacity, ec2_enabled
+from .team_pools import dedicated_teams
+
 
 class Ecs(Construct):
     _config: Dict
     _cluster: ecs.ICluster
     _selenium_service: ecs.FargateService
+    _ec2_service: Optional[ecs.Ec2Service]
+    _ec2_capacity: Optional[Ec2Capacity]
     _vpc: ec2.Vpc
 
     def __init__(
@@ -31,7 +44,7 @@ class Ecs(Construct):
         self._config = config
         self._vpc = vpc
         self.__create_ecs_cluster()
-        for index in range(0, config["compute"]["ecs"]["selenium"]["service_count"]):
+        for index in range(0, config["compute"]["ecs"]["selenium"].get("service_count", 1)):
             self.__create_selenium_service(index)
 
     def __create_ecs_cluster(self):
@@ -41,60 +54,42 @@ class Ecs(Construct):
             "selenium",
             cluster_name="selenium_cluster_" + self._config["stage"],
             vpc=self._vpc,
+            enable_fargate_capacity_providers=True,
+            # Task counts tell when the EC2 baselines fall short and when a team grid
+            # has no node.
+            container_insights=True
+            if self.__has_ec2_baseline() or dedicated_teams(self._config)
+            else None,
         )
+        # Optional EC2 capacity for the baseline of the pools, Fargate takes the bursts.
+        self._ec2_capacity = None
+        if ec2_enabled(self._config):
+            self._ec2_capacity = Ec2Capacity(
+                self, "Ec2Capacity", self._config, self._cluster, self._vpc
+            )
 
-    def __create_selenium_service(self, index):
-        # Create Fargate task definition for ui
+    def __has_ec2_baseline(self):
+        return "ec2_baseline" in self._config["compute"]["ecs"]["selenium"]
 
-        # Import ECR repository for ui
+    def __create_selenium_service(self, index):
+        selenium = self._config["compute"]["ecs"]["selenium"]
+        # With an EC2 baseline the Fargate service only runs the bursts.
+        fargate_minimum = 0 if self.__has_ec2_baseline() else selenium["minimum_containers"]
 
         # Create Fargate task definition for ui
-        selenium_taskdef = ecs.FargateTaskDefinition(
+        selenium_taskdef = create_fargate_task_definition(
             self,
             "selenium-taskdef" + str(index),
-            memory_limit_mib=self._config["compute"]["ecs"]["selenium"]["memory"],
-            cpu=self._config["compute"]["ecs"]["selenium"]["cpu"],
+            container_id="ui-container" + str(index),
+            image=selenium["repo_arn"] + ":" + selenium["image_tag"],
+            cpu=selenium["cpu"],
+            memory=selenium["memory"],
+            log_group_id="SeleniumWebAppServerLogGroup" + str(index),
+            log_group_name="/ecs/Seleniumwebapp-server" + str(index),
+            stream_prefix="Seleniumwebapp" + str(index),
+            ports=[selenium["port"]],
         )
 
-        selenium_container = selenium_taskdef.add_container(
-            "ui-container" + str(index),
-            image=ecs.ContainerImage.from_registry(
-                name=self._config["compute"]["ecs"]["selenium"]["repo_arn"]
-                + ":"
-                + self._config["compute"]["ecs"]["selenium"]["image_tag"],
-            ),
-            logging=ecs.LogDriver.aws_logs(
-                stream_prefix="Seleniumwebapp" + str(index),
-                log_group=aws_logs.LogGroup(
-                    self,
-                    "SeleniumWebAppServerLogGroup" + str(index),
-                    log_group_name="/ecs/Seleniumwebapp-server" + str(index),
-                    retention=aws_logs.RetentionDays.ONE_WEEK,
-                    removal_policy=RemovalPolicy.DESTROY,
-                ),
-            ),
-        )
-        selenium_container.add_port_mappings(
-            ecs.PortMapping(
-                container_port=self._config["compute"]["ecs"]["selenium"]["port"]
-            )
-        )
-
-        capacity = [
-            ecs.CapacityProviderStrategy(
-                capacity_provider="FARGATE_SPOT",
-                weight=self._config["compute"]["ecs"]["selenium"]["fargate_spot"][
-                    "weight"
-                ],
-                base=self._config["compute"]["ecs"]["selenium"]["fargate_spot"]["base"],
-            ),
-            ecs.CapacityProviderStrategy(
-                capacity_provider="FARGATE",
-                weight=self._config["compute"]["ecs"]["selenium"]["fargate"]["weight"],
-                base=self._config["compute"]["ecs"]["selenium"]["fargate"]["base"],
-            ),
-        ]
-
         selenium_security_group = ec2.SecurityGroup(
             self,
             "SeleniumWebAppSecurityGroup" + str(index),
@@ -110,46 +105,177 @@ class Ecs(Construct):
             "Seleniumwebapp-service" + str(index),
             cluster=self._cluster,
             security_groups=[selenium_security_group],
-            desired_count=self._config["compute"]["ecs"]["selenium"][
-                "minimum_containers"
-            ],
+            desired_count=fargate_minimum,
             service_name="Seleniumwebapp-" + self._config["stage"] + str(index),
             task_definition=selenium_taskdef,
             assign_public_ip=True,
-            capacity_provider_strategies=capacity,
+            capacity_provider_strategies=fargate_capacity(selenium),
         )
 
-        # Enable auto scaling for the frontend service
-        scaling = autoscaling.ScalableTarget(
+        self._ec2_service = None
+        if self.__has_ec2_baseline():
+            self.__create_ec2_baseline_service(index, selenium_security_group)
+            self.__scale_burst_on_ec2_shortfall(index)
+        else:
+            # Enable auto scaling for the frontend service
+            scale_on_cpu(
+                self,
+                "Selenium-webapp-scaling" + str(index),
+                "ScaleToCPUWithMultipleDatapoints" + str(index),
+                self._cluster,
+                self._selenium_service,
+                min_capacity=selenium["minimum_containers"],
+                max_capacity=selenium["maximum_containers"],
+            )
+
+        self.__setup_application_load_balancer(index)
+
+    def __create_ec2_baseline_service(self, index, security_group):
+        selenium = self._config["compute"]["ecs"]["selenium"]
+        baseline = selenium["ec2_baseline"]
+        if self._ec2_capacity is None:
+            raise ValueError(
+                "compute.ecs.selenium.ec2_baseline needs compute.ecs.ec2.enabled: true."
+            )
+
+        # Create EC2 task definition, bin-packed on the instances of the ASG
+        selenium_taskdef = ecs.Ec2TaskDefinition(
             self,
-            "Selenium-webapp-scaling" + str(index),
-            service_namespace=autoscaling.ServiceNamespace.ECS,
-            resource_id=f"service/{self._cluster.cluster_name}/{self._selenium_service.service_name}",
-            scalable_dimension="ecs:service:DesiredCount",
-            min_capacity=self._config["compute"]["ecs"]["selenium"][
-                "minimum_containers"
-            ],
-            max_capacity=self._config["compute"]["ecs"]["selenium"][
-                "maximum_containers"
+            "selenium-ec2-taskdef" + str(index),
+            network_mode=ecs.NetworkMode.AWS_VPC,
+        )
+        selenium_container = selenium_taskdef.add_container(
+            "ec2-container" + str(index),
+            image=ecs.ContainerImage.from_registry(
+                name=selenium["repo_arn"] + ":" + selenium["image_tag"],
+            ),
+            cpu=selenium["cpu"],
+            memory_limit_mib=selenium["memory"],
+            # Unlike Fargate, EC2 tasks can size the /dev/shm tmpfs Chrome needs.
+            linux_parameters=ecs.LinuxParameters(
+                self,
+                "ec2-linux-parameters" + str(index),
+                shared_memory_size=baseline.get("shm_size", 2048),
+            ),
+            logging=ecs.LogDriver.aws_logs(
+                stream_prefix="Seleniumwebapp-ec2" + str(index),
+                log_group=aws_logs.LogGroup(
+                    self,
+                    "SeleniumWebAppEc2LogGroup" + str(index),
+                    log_group_name="/ecs/Seleniumwebapp-ec2-server" + str(index),
+                    retention=aws_logs.RetentionDays.ONE_WEEK,
+                    removal_policy=RemovalPolicy.DESTROY,
+                ),
+            ),
+        )
+        selenium_container.add_port_mappings(
+            ecs.PortMapping(container_port=selenium["port"])
+        )
+
+        self._ec2_service = ecs.Ec2Service(
+            self,
+            "Seleniumwebapp-ec2-service" + str(index),
+            cluster=self._cluster,
+            security_groups=[security_group],
+            vpc_subnets=self._ec2_capacity.vpc_subnets,
+            desired_count=baseline["minimum_containers"],
+            service_name="Seleniumwebapp-ec2-" + self._config["stage"] + str(index),
+            task_definition=selenium_taskdef,
+            placement_strategies=[ecs.PlacementStrategy.packed_by_memory()],
+            capacity_provider_strategies=[
+                ecs.CapacityProviderStrategy(
+                    capacity_provider=self._ec2_capacity.capacity_provider.capacity_provider_name,
+                    weight=1,
+                )
             ],
         )
+        # The capacity provider must be associated before the service uses it.
+        self._ec2_service.node.add_dependency(self._cluster)
 
+        scaling = service_scalable_target(
+            self,
+            "Selenium-webapp-ec2-scaling" + str(index),
+            self._cluster,
+            self._ec2_service,
+            min_capacity=baseline["minimum_containers"],
+            max_capacity=baseline["maximum_containers"],
+        )
         scaling.scale_on_metric(
-            "ScaleToCPUWithMultipleDatapoints" + str(index),
-            metric=cloudwatch.Metric(
-                namespace="AWS/ECS",
-                metric_name="CPUUtilization",
+            "Ec2ScaleToCPUWithMultipleDatapoints" + str(index),
+            metric=service_metric(
+                self._cluster, self._ec2_service, "AWS/ECS", "CPUUtilization"
             ),
             scaling_steps=[
-                autoscaling.ScalingInterval(change=-1, lower=10),
                 autoscaling.ScalingInterval(change=+1, lower=50),
                 autoscaling.ScalingInterval(change=+3, lower=70),
             ],
             evaluation_periods=10,
             datapoints_to_alarm=6,
         )
+        # Only when idle, not when Fargate takes part of the load off the EC2 tasks.
+        scale_in_when_idle(
+            scaling, "Ec2ScaleInIdle" + str(index), self._cluster, self._ec2_service
+        )
 
-        self.__setup_application_load_balancer(index)
+    def __scale_burst_on_ec2_shortfall(self, index):
+        selenium = self._config["compute"]["ecs"]["selenium"]
+        baseline = selenium["ec2_baseline"]
+
+        def ec2_metric(namespace, metric_name, **kwargs):
+            return service_metric(
+                self._cluster, self._ec2_service, namespace, metric_name, **kwargs
+            )
+
+        # Baseline tasks EC2 can't run right now: not placed or still pending while spot
+        # capacity is short, the ASG is at max_capacity or instances leave the warm pool.
+        # Plus one while the baseline is at its maximum and still busy.
+        shortfall = cloudwatch.MathExpression(
+            expression=(
+                "FILL(desired, 0) - FILL(running, 0) + "
+                f"IF(FILL(desired, 0) >= {baseline['maximum_containers']} "
+                "AND FILL(ec2_cpu, 0) >= 50, 1, 0)"
+            ),
+            using_metrics={
+                "desired": ec2_metric(
+                    "ECS/ContainerInsights", "DesiredTaskCount", statistic="Maximum"
+                ),
+                "running": ec2_metric(
+                    "ECS/ContainerInsights", "RunningTaskCount", statistic="Minimum"
+                ),
+                "ec2_cpu": ec2_metric("AWS/ECS", "CPUUtilization"),
+            },
+            label="EC2 baseline shortfall",
+            period=Duration.minutes(1),
+        )
+
+        scaling = service_scalable_target(
+            self,
+            "Selenium-webapp-scaling" + str(index),
+            self._cluster,
+            self._selenium_service,
+            min_capacity=0,
+            max_capacity=selenium["maximum_containers"],
+        )
+        scaling.scale_on_metric(
+            "ScaleOnEc2Shortfall" + str(index),
+            metric=shortfall,
+            scaling_steps=[
+                autoscaling.ScalingInterval(change=+1, lower=1),
+                autoscaling.ScalingInterval(change=+3, lower=3),
+            ],
+            # Placing a task takes a minute, don't burst for that.
+            evaluation_periods=3,
+            datapoints_to_alarm=2,
+        )
+        # Fargate tasks hold live sessions: remove them once idle, not as soon as EC2
+        # has room again.
+        scale_in_when_idle(
+            scaling,
+            "ScaleInIdle" + str(index),
+            self._cluster,
+            self._selenium_service,
+            shortfall,
+        )
 
     def __setup_application_load_balancer(self, index):
         # Create security group for the load balancer
@@ -184,7 +310,8 @@ class Ecs(Construct):
             vpc=self._cluster.vpc,
             port=self._config["compute"]["ecs"]["selenium"]["port"],
             protocol=elbv2.ApplicationProtocol.HTTP,
-            targets=[self._selenium_service],
+            targets=[self._selenium_service]
+            + ([self._ec2_service] if self._ec2_service else []),
             health_check=elbv2.HealthCheck(
                 path="/ui",
                 protocol=elbv2.Protocol.HTTP,
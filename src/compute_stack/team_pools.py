@@ -0,0 +1,375 @@
+from typing import Dict, List
+
+from aws_cdk import (
+    aws_ec2 as ec2,
+    aws_ecs as ecs,
+    aws_cloudwatch as cloudwatch,
+    Duration,
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_servicediscovery as servicediscovery,
+    aws_applicationautoscaling as autoscaling,
+)
+from constructs import Construct
+
+from .browser import (
+    create_fargate_task_definition,
+    fargate_capacity,
+    scale_in_when_idle,
+    service_metric,
+    service_scalable_target,
+)
+
+TEAM_MODES = ["dedicated", "shared"]
+HUB_IMAGE = "selenium/hub"
+NODE_IMAGE = "selenium/node-chrome"
+# Ports the grid nodes use to reach the hub event bus, and the hub to reach the nodes.
+EVENT_BUS_PUBLISH_PORT = 4442
+EVENT_BUS_SUBSCRIBE_PORT = 4443
+NODE_PORT = 5555
+# A single hub owns the team's session queue.
+HUB_TASKS = 1
+# Nodes are added once new sessions wait longer than this in the hub queue.
+SCALE_OUT_WAIT_SECONDS = 10
+# A team's listener rules use priorities priority * 10 + 1 and + 2, ALB allows up to 50000.
+MAX_TEAM_PRIORITY = 4998
+# How long the hub keeps a new session request queued before failing it.
+SESSION_REQUEST_TIMEOUT = 300
+
+
+def dedicated_teams(config: Dict) -> List[Dict]:
+    teams = config["compute"]["ecs"].get("teams") or []
+    for team in teams:
+        if team.get("mode", "shared") not in TEAM_MODES:
+            raise ValueError(
+                f"Team '{team['name']}' mode must be one of {TEAM_MODES}."
+            )
+    return [team for team in teams if team.get("mode", "shared") == "dedicated"]
+
+
+def max_team_tasks(team: Dict) -> int:
+    # The team's nodes at their quota plus its hub.
+    return team["maximum_containers"] + HUB_TASKS
+
+
+class TeamPools(Construct):
+    """Dedicated grids for the teams of config["compute"]["ecs"]["teams"].
+
+    Teams in `shared` mode keep using the shared selenium services. Each
+    `dedicated` team gets its own hub and chrome node service, the nodes scaled
+    between the team's minimum/maximum_containers, so a large run only queues
+    behind itself. All hubs sit behind one ALB and are routed by path: the grid
+    of team `qa` is served under /qa (SE_SUB_PATH). New session requests
+    (POST /<team>/session) go to a separate target group, whose
+    TargetResponseTime is the time a request waited in the team hub's queue plus
+    the browser start. The nodes scale on that queue, not on their CPU: new
+    sessions requested while the team has no node, or while they wait longer
+    than scale_out_wait_seconds, add nodes, which also works from 0 nodes.
+    """
+
+    _config: Dict
+    _cluster: ecs.ICluster
+    _vpc: ec2.IVpc
+    _namespace: servicediscovery.PrivateDnsNamespace
+    _listener: elbv2.ApplicationListener
+    _dashboard: cloudwatch.Dashboard
+
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        config: Dict,
+        cluster: ecs.ICluster,
+        vpc: ec2.IVpc,
+    ) -> None:
+        super().__init__(scope, id)
+        self._config = config
+        self._cluster = cluster
+        self._vpc = vpc
+        # Nodes find their hub event bus as <team>-hub.<namespace>.
+        self._namespace = servicediscovery.PrivateDnsNamespace(
+            self,
+            "Namespace",
+            name="selenium-teams-" + config["stage"] + ".local",
+            vpc=vpc,
+        )
+        self.__setup_application_load_balancer()
+        self._dashboard = cloudwatch.Dashboard(
+            self,
+            "QueueWaitDashboard",
+            dashboard_name="Selenium-teams-" + config["stage"],
+        )
+        teams = dedicated_teams(config)
+        self.__validate_priorities(teams)
+        for team in teams:
+            self.__create_team_grid(team)
+
+    def __setup_application_load_balancer(self):
+        lb_security_group = ec2.SecurityGroup(
+            self,
+            "LoadBalancerSecurityGroup",
+            vpc=self._vpc,
+            allow_all_outbound=True,
+        )
+        lb_security_group.add_ingress_rule(
+            peer=ec2.Peer.any_ipv4(),
+            connection=ec2.Port.tcp(80),
+        )
+
+        self.lb = elbv2.ApplicationLoadBalancer(
+            self,
+            "LoadBalancer",
+            vpc=self._vpc,
+            internet_facing=True,
+            security_group=lb_security_group,
+            # Queued new session requests are held open until the hub serves them.
+            idle_timeout=Duration.seconds(SESSION_REQUEST_TIMEOUT + 10),
+        )
+        # Unknown teams get a 404 instead of landing on another team's grid.
+        self._listener = self.lb.add_listener(
+            "HttpListener",
+            port=80,
+            protocol=elbv2.ApplicationProtocol.HTTP,
+            default_action=elbv2.ListenerAction.fixed_response(
+                404, content_type="text/plain", message_body="Unknown team"
+            ),
+        )
+
+    def __validate_priorities(self, teams):
+        # Rule priorities are fixed per team, so adding, removing or reordering teams
+        # never moves the rules of another team onto a priority still in use.
+        used = {}
+        for team in teams:
+            priority = team.get("priority")
+            if not isinstance(priority, int) or not 0 <= priority <= MAX_TEAM_PRIORITY:
+                raise ValueError(
+                    f"Team '{team['name']}' needs a priority between 0 and "
+                    f"{MAX_TEAM_PRIORITY} for its listener rules."
+                )
+            if priority in used:
+                raise ValueError(
+                    f"Teams '{used[priority]}' and '{team['name']}' have the same "
+                    f"priority {priority}."
+                )
+            used[priority] = team["name"]
+
+    def __create_team_grid(self, team):
+        name = team["name"]
+        selenium = self._config["compute"]["ecs"]["selenium"]
+        pool = {
+            "fargate_spot": team.get("fargate_spot", selenium["fargate_spot"]),
+            "fargate": team.get("fargate", selenium["fargate"]),
+        }
+
+        # Hub and nodes talk to each other, the ALB ingress to the hub is added
+        # when its target groups are registered.
+        security_group = ec2.SecurityGroup(
+            self,
+            "SecurityGroup-" + name,
+            vpc=self._vpc,
+            allow_all_outbound=True,
+        )
+        security_group.connections.allow_internally(
+            ec2.Port.tcp_range(EVENT_BUS_PUBLISH_PORT, EVENT_BUS_SUBSCRIBE_PORT)
+        )
+        security_group.connections.allow_internally(ec2.Port.tcp(NODE_PORT))
+
+        hub_taskdef = create_fargate_task_definition(
+            self,
+            "hub-taskdef-" + name,
+            container_id="hub-" + name,
+            image=team.get("hub_repo_arn", HUB_IMAGE) + ":" + selenium["image_tag"],
+            cpu=team.get("hub_cpu", 512),
+            memory=team.get("hub_memory", 1024),
+            log_group_id="HubLogGroup-" + name,
+            log_group_name="/ecs/Selenium-team-" + name + "-hub",
+            stream_prefix="Selenium-" + name + "-hub",
+            ports=[selenium["port"], EVENT_BUS_PUBLISH_PORT, EVENT_BUS_SUBSCRIBE_PORT],
+            environment={
+                "SE_SUB_PATH": "/" + name,
+                "SE_SESSION_REQUEST_TIMEOUT": str(SESSION_REQUEST_TIMEOUT),
+            },
+            shm=False,
+        )
+        # The hub routes every session call of the team.
+        hub_service = ecs.FargateService(
+            self,
+            "hub-service-" + name,
+            cluster=self._cluster,
+            security_groups=[security_group],
+            desired_count=HUB_TASKS,
+            service_name="Selenium-" + self._config["stage"] + "-" + name + "-hub",
+            task_definition=hub_taskdef,
+            assign_public_ip=True,
+            # On-demand: a spot interruption would drop the team's whole session queue.
+            capacity_provider_strategies=[
+                ecs.CapacityProviderStrategy(capacity_provider="FARGATE", weight=1)
+            ],
+            cloud_map_options=ecs.CloudMapOptions(
+                name=name + "-hub", cloud_map_namespace=self._namespace
+            ),
+        )
+
+        node_taskdef = create_fargate_task_definition(
+            self,
+            "node-taskdef-" + name,
+            container_id="node-" + name,
+            image=team.get("node_repo_arn", NODE_IMAGE) + ":" + selenium["image_tag"],
+            cpu=team.get("cpu", selenium["cpu"]),
+            memory=team.get("memory", selenium["memory"]),
+            log_group_id="NodeLogGroup-" + name,
+            log_group_name="/ecs/Selenium-team-" + name + "-node",
+            stream_prefix="Selenium-" + name + "-node",
+            ports=[NODE_PORT],
+            environment={
+                "SE_EVENT_BUS_HOST": f"{name}-hub.{self._namespace.namespace_name}",
+                "SE_EVENT_BUS_PUBLISH_PORT": str(EVENT_BUS_PUBLISH_PORT),
+                "SE_EVENT_BUS_SUBSCRIBE_PORT": str(EVENT_BUS_SUBSCRIBE_PORT),
+            },
+        )
+        node_service = ecs.FargateService(
+            self,
+            "node-service-" + name,
+            cluster=self._cluster,
+            security_groups=[security_group],
+            desired_count=team["minimum_containers"],
+            service_name="Selenium-" + self._config["stage"] + "-" + name + "-node",
+            task_definition=node_taskdef,
+            assign_public_ip=True,
+            capacity_provider_strategies=fargate_capacity(pool),
+        )
+
+        session_target_group = self.__route_team(team, hub_service)
+        self.__scale_on_queue(team, node_service, session_target_group)
+
+    def __route_team(self, team, hub_service):
+        name = team["name"]
+        port = self._config["compute"]["ecs"]["selenium"]["port"]
+        health_check = elbv2.HealthCheck(
+            path=f"/{name}/status",
+            protocol=elbv2.Protocol.HTTP,
+            port=str(port),
+            interval=Duration.seconds(60),
+            timeout=Duration.seconds(30),
+            healthy_threshold_count=2,
+            unhealthy_threshold_count=5,
+        )
+
+        session_target_group = elbv2.ApplicationTargetGroup(
+            self,
+            "SessionTargetGroup-" + name,
+            vpc=self._vpc,
+            port=port,
+            protocol=elbv2.ApplicationProtocol.HTTP,
+            targets=[hub_service],
+            health_check=health_check,
+        )
+        target_group = elbv2.ApplicationTargetGroup(
+            self,
+            "TargetGroup-" + name,
+            vpc=self._vpc,
+            port=port,
+            protocol=elbv2.ApplicationProtocol.HTTP,
+            targets=[hub_service],
+            health_check=health_check,
+        )
+
+        self._listener.add_target_groups(
+            "NewSession-" + name,
+            priority=team["priority"] * 10 + 1,
+            conditions=[
+                elbv2.ListenerCondition.path_patterns([f"/{name}/session"]),
+                elbv2.ListenerCondition.http_request_methods(["POST"]),
+            ],
+            target_groups=[session_target_group],
+        )
+        self._listener.add_target_groups(
+            "Grid-" + name,
+            priority=team["priority"] * 10 + 2,
+            conditions=[elbv2.ListenerCondition.path_patterns([f"/{name}/*"])],
+            target_groups=[target_group],
+        )
+
+        self.__publish_queue_wait(team, session_target_group)
+        return session_target_group
+
+    def __scale_on_queue(self, team, node_service, session_target_group):
+        name = team["name"]
+        # The team quota: its grid never grows past maximum_containers nodes.
+        scaling = service_scalable_target(
+            self,
+            "scaling-" + name,
+            self._cluster,
+            node_service,
+            min_capacity=team["minimum_containers"],
+            max_capacity=team["maximum_containers"],
+        )
+
+        # The hub answers new session requests even without nodes, so the session target
+        # group metrics exist at 0 nodes. Sessions queue when there is no node at all, or
+        # when they wait in the hub longer than the scale out wait: count them then.
+        period = Duration.minutes(1)
+        queued_sessions = cloudwatch.MathExpression(
+            expression=(
+                "IF(FILL(nodes, 0) < 1 OR FILL(wait, 0) > "
+                f"{team.get('scale_out_wait_seconds', SCALE_OUT_WAIT_SECONDS)}, "
+                "FILL(requests, 0), 0)"
+            ),
+            using_metrics={
+                "requests": session_target_group.metric_request_count(period=period),
+                "wait": session_target_group.metric_target_response_time(
+                    statistic="p95", period=period
+                ),
+                "nodes": service_metric(
+                    self._cluster,
+                    node_service,
+                    "ECS/ContainerInsights",
+                    "RunningTaskCount",
+                    statistic="Minimum",
+                ),
+            },
+            label=f"{name} queued new sessions",
+            period=period,
+        )
+        scaling.scale_on_metric(
+            "ScaleOnQueue-" + name,
+            metric=queued_sessions,
+            scaling_steps=[
+                autoscaling.ScalingInterval(change=+1, lower=1),
+                autoscaling.ScalingInterval(change=+3, lower=10),
+            ],
+            evaluation_periods=1,
+        )
+
+        scale_in_when_idle(
+            scaling, "ScaleInIdle-" + name, self._cluster, node_service, queued_sessions
+        )
+
+    def __publish_queue_wait(self, team, session_target_group):
+        name = team["name"]
+        queue_wait = session_target_group.metric_target_response_time(
+            statistic="p95", period=Duration.minutes(1)
+        )
+        self._dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title=f"{name} new session wait (p95)",
+                left=[queue_wait],
+                right=[
+                    session_target_group.metric_request_count(
+                        period=Duration.minutes(1)
+                    )
+                ],
+            )
+        )
+
+        if team.get("queue_wait_slo_seconds") is not None:
+            cloudwatch.Alarm(
+                self,
+                "QueueWaitSlo-" + name,
+                alarm_description=f"Team {name} new sessions wait longer than its SLO",
+                metric=queue_wait,
+                threshold=team["queue_wait_slo_seconds"],
+                comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                evaluation_periods=5,
+                datapoints_to_alarm=3,
+                treat_missing_data=cloudwatch.TreatMissingData.NOT_BREACHING,
+            )
@@ -0,0 +1,153 @@
+import ipaddress
+import math
+from typing import Dict, List, Optional
+
+from aws_cdk import aws_ec2 as ec2
+
+from src.compute_stack.ec2_capacity import (
+    baseline_task_count,
+    ec2_enabled,
+    ec2_subnet_group_name,
+)
+from src.compute_stack.team_pools import dedicated_teams, max_team_tasks
+
+# AWS keeps the first four and the last address of every subnet.
+AWS_RESERVED_IPS = 5
+# An ALB needs at least 8 free addresses in each of its subnets to scale.
+ALB_FREE_IPS = 8
+# Subnet mask bounds accepted by EC2.
+MIN_CIDR_MASK = 16
+MAX_CIDR_MASK = 28
+
+
+class SubnetPlanner:
+    """Sizes the VPC subnets from the task fleet described in the stage config.
+
+    Every task (awsvpc network mode) takes one ENI, hence one IP, in the subnet
+    it is placed in. The planner sums the maximum task count of every pool,
+    allows for deployment surge and the loss of one AZ, and either picks a
+    cidrMask for the task subnet (and the EC2 capacity subnet, if any) or
+    checks that the configured one is large enough. Capacity problems are raised
+    at synth time instead of showing up as failed task placements during a
+    scale-out.
+    """
+
+    config: Dict
+
+    def __init__(self, config: Dict) -> None:
+        self.config = config
+        planning = config["network"].get("planning") or {}
+        self.task_subnet_name = planning.get("taskSubnetName", "Public")
+        # Rolling deployments run old and new tasks side by side (200% max healthy).
+        self.surge_factor = planning.get("surgeFactor", 2)
+        self.max_azs = config["network"]["vpc"]["maxAzs"]
+
+    def max_task_count(self) -> int:
+        # Peak number of Fargate tasks across all pools at their configured maximum.
+        if not self.__has_ecs():
+            return 0
+        total = 0
+
+        selenium = self.config["compute"]["ecs"].get("selenium")
+        if selenium:
+            total += selenium.get("service_count", 1) * selenium["maximum_containers"]
+
+        for team in dedicated_teams(self.config):
+            total += max_team_tasks(team)
+
+        return total
+
+    def load_balancer_count(self) -> int:
+        if not self.__has_ecs():
+            return 0
+        count = 0
+
+        selenium = self.config["compute"]["ecs"].get("selenium")
+        if selenium:
+            count += selenium.get("service_count", 1)
+
+        if dedicated_teams(self.config):
+            # All dedicated team pools share one load balancer.
+            count += 1
+
+        return count
+
+    def max_ec2_ip_count(self) -> int:
+        # EC2 baseline tasks plus the instances, running or kept in the warm pool.
+        if not self.__has_ecs() or not ec2_enabled(self.config):
+            return 0
+        instances = self.config["compute"]["ecs"]["ec2"]["max_capacity"]
+        return 2 * instances + baseline_task_count(self.config)
+
+    def ec2_subnet_name(self) -> Optional[str]:
+        if not self.__has_ecs() or not ec2_enabled(self.config):
+            return None
+        return ec2_subnet_group_name(self.config)
+
+    def __has_ecs(self) -> bool:
+        return bool((self.config.get("compute") or {}).get("ecs"))
+
+    def required_ips_per_subnet(self, subnet_name: Optional[str] = None) -> int:
+        subnet_name = subnet_name or self.task_subnet_name
+        task_count = 0
+        extra_ips = AWS_RESERVED_IPS
+        if subnet_name == self.task_subnet_name:
+            task_count += self.max_task_count()
+            extra_ips += self.load_balancer_count() * ALB_FREE_IPS
+        if subnet_name == self.ec2_subnet_name():
+            task_count += self.max_ec2_ip_count()
+
+        # Spread the surged fleet over the AZs left after losing one of them.
+        surviving_azs = max(self.max_azs - 1, 1)
+        return math.ceil(task_count * self.surge_factor / surviving_azs) + extra_ips
+
+    def plan(self) -> List[ec2.SubnetConfiguration]:
+        sized_subnets = [self.task_subnet_name, self.ec2_subnet_name()]
+        subnet_configuration = []
+        masks = []
+
+        for subnet in self.config["network"]["subnets"]:
+            cidr_mask = subnet.get("cidrMask")
+            if subnet["name"] in sized_subnets:
+                required_ips = self.required_ips_per_subnet(subnet["name"])
+                if cidr_mask is None:
+                    cidr_mask = self.__smallest_mask_for(required_ips)
+                elif 2 ** (32 - cidr_mask) < required_ips:
+                    raise ValueError(
+                        f"Subnet '{subnet['name']}' /{cidr_mask} holds "
+                        f"{2 ** (32 - cidr_mask)} IPs but {required_ips} are needed "
+                        f"in each of the {self.max_azs} AZs. "
+                        "Lower cidrMask or remove it to let the planner size it."
+                    )
+            elif cidr_mask is None:
+                raise ValueError(f"Subnet '{subnet['name']}' needs a cidrMask.")
+
+            masks.append(cidr_mask)
+            subnet_configuration.append(
+                ec2.SubnetConfiguration(
+                    name=subnet["name"],
+                    subnet_type=ec2.SubnetType[subnet["subnetType"]],
+                    cidr_mask=cidr_mask,
+                )
+            )
+
+        self.__validate_vpc_capacity(masks)
+        return subnet_configuration
+
+    def __smallest_mask_for(self, required_ips: int) -> int:
+        mask = 32 - math.ceil(math.log2(required_ips))
+        if mask < MIN_CIDR_MASK:
+            raise ValueError(
+                f"{required_ips} IPs per subnet exceed the largest subnet size "
+                f"(/{MIN_CIDR_MASK})."
+            )
+        return min(mask, MAX_CIDR_MASK)
+
+    def __validate_vpc_capacity(self, masks: List[int]) -> None:
+        vpc_cidr = ipaddress.ip_network(self.config["network"]["vpc"]["cidr"])
+        needed = sum(2 ** (32 - mask) for mask in masks) * self.max_azs
+        if needed > vpc_cidr.num_addresses:
+            raise ValueError(
+                f"VPC {vpc_cidr} has {vpc_cidr.num_addresses} addresses but the "
+                f"subnets need {needed} across {self.max_azs} AZs."
+            )
@@ -3,11 +3,13 @@ from typing import Dict, List
 from aws_cdk import aws_ec2 as ec2
 from constructs import Construct
 
+from .subnet_planner import SubnetPlanner
+
 
 class Vpc(Construct):
     config: Dict
     vpc: ec2.Vpc
-    subnet_configuration: List[ec2.SubnetConfiguration] = []
+    subnet_configuration: List[ec2.SubnetConfiguration]
 
     def __init__(self, scope: Construct, id: str, config: Dict) -> None:
         super().__init__(scope, id)
@@ -45,11 +47,5 @@ class Vpc(Construct):
             )
 
     def __build_subnets_config(self):
-        for subnet in self.config["network"]["subnets"]:
-            self.subnet_configuration.append(
-                ec2.SubnetConfiguration(
-                    name=subnet["name"],
-                    subnet_type=ec2.SubnetType[subnet["subnetType"]],
-                    cidr_mask=subnet["cidrMask"],
-                )
-            )
+        # Built per instance so several Vpc constructs in one app don't share subnets.
+        self.subnet_configuration = SubnetPlanner(self.config).plan()
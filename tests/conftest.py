@@ -0,0 +1,85 @@
+import glob
+import json
+import os
+
+import pytest
+from aws_cdk import App, Environment, assertions
+
+from src.network_stack.network_stack import NetworkStack
+from src.compute_stack.compute_stack import ComputeStack
+from utils import config_util
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Keep well below the 500 resources CloudFormation allows per stack.
+RESOURCE_BUDGET = {"network": 40, "compute": 100}
+
+STAGES = sorted(
+    os.path.splitext(os.path.basename(path))[0]
+    for path in glob.glob(os.path.join(ROOT_DIR, "config", "*.yaml"))
+    if os.path.basename(path) != "common.yaml"
+)
+
+
+# Same context as `cdk synth`: cdk.json flags plus the cached lookups of cdk.context.json,
+# so the stacks synthesize offline.
+def load_context() -> dict:
+    with open(os.path.join(ROOT_DIR, "cdk.json")) as f:
+        context = json.load(f).get("context", {})
+    with open(os.path.join(ROOT_DIR, "cdk.context.json")) as f:
+        context.update(json.load(f))
+    return context
+
+
+class SynthesizedApp:
+    def __init__(self, stage: str, overrides: dict = None) -> None:
+        self.config = config_util.load_config(stage)
+        if overrides:
+            self.config.merge(overrides)
+        app = App(context={**load_context(), "stage": stage})
+        env = Environment(
+            account=self.config["aws_account"],
+            region=self.config["aws_region"],
+        )
+        network_stack = NetworkStack(
+            app, "Selenium-NetworkStack-" + stage, config=self.config, env=env
+        )
+        compute_stack = ComputeStack(
+            app,
+            "Selenium-ComputeStack-" + stage,
+            vpc=network_stack._vpc,
+            config=self.config,
+            env=env,
+        )
+        assembly = app.synth()
+        with open(os.path.join(assembly.directory, "manifest.json")) as f:
+            # Context lookups that cdk.context.json couldn't answer.
+            self.missing_context = json.load(f).get("missing", [])
+        self.network = assertions.Template.from_stack(network_stack)
+        self.compute = assertions.Template.from_stack(compute_stack)
+
+
+def synthesize(stage: str, overrides: dict = None) -> SynthesizedApp:
+    cwd = os.getcwd()
+    # config_util reads config/ relative to the working directory.
+    os.chdir(ROOT_DIR)
+    try:
+        return SynthesizedApp(stage, overrides)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def synthesize_app():
+    # Factory for tests that need a stage synthesized with config overrides.
+    return synthesize
+
+
+@pytest.fixture(scope="session")
+def resource_budget() -> dict:
+    return RESOURCE_BUDGET
+
+
+@pytest.fixture(scope="session", params=STAGES)
+def synthesized(request) -> SynthesizedApp:
+    return synthesize(request.param)
@@ -0,0 +1,144 @@
+from aws_cdk import assertions
+
+from src.compute_stack.team_pools import HUB_IMAGE, dedicated_teams
+
+
+def selenium_config(synthesized):
+    return synthesized.config["compute"]["ecs"]["selenium"]
+
+
+def service_count(synthesized):
+    return selenium_config(synthesized).get("service_count", 1)
+
+
+def team_count(synthesized):
+    return len(dedicated_teams(synthesized.config))
+
+
+def shared_resources(synthesized, type, props=None):
+    # Resources of the shared selenium services, built by the Ecs construct.
+    resources = synthesized.compute.find_resources(
+        type, {"Properties": props} if props else None
+    )
+    return {id: r for id, r in resources.items() if id.startswith("Ecs")}
+
+
+def test_resource_budget(synthesized, resource_budget):
+    resources = synthesized.compute.to_json()["Resources"]
+    assert len(resources) <= resource_budget["compute"]
+
+
+def test_fargate_capacity_providers_associated(synthesized):
+    # Services can only use FARGATE_SPOT if the cluster has it associated.
+    synthesized.compute.has_resource_properties(
+        "AWS::ECS::ClusterCapacityProviderAssociations",
+        {"CapacityProviders": assertions.Match.array_with(["FARGATE", "FARGATE_SPOT"])},
+    )
+
+
+def test_capacity_provider_weights(synthesized):
+    selenium = selenium_config(synthesized)
+    # Shared services, plus a hub and a node service per dedicated team.
+    synthesized.compute.resource_count_is(
+        "AWS::ECS::Service", service_count(synthesized) + 2 * team_count(synthesized)
+    )
+    services = shared_resources(
+        synthesized,
+        "AWS::ECS::Service",
+        {
+            "CapacityProviderStrategy": [
+                {
+                    "CapacityProvider": "FARGATE_SPOT",
+                    "Weight": selenium["fargate_spot"]["weight"],
+                    "Base": selenium["fargate_spot"]["base"],
+                },
+                {
+                    "CapacityProvider": "FARGATE",
+                    "Weight": selenium["fargate"]["weight"],
+                    "Base": selenium["fargate"]["base"],
+                },
+            ],
+        },
+    )
+    assert len(services) == service_count(synthesized)
+
+
+def test_public_ip_and_subnet_placement(synthesized):
+    max_azs = synthesized.config["network"]["vpc"]["maxAzs"]
+    services = synthesized.compute.find_resources("AWS::ECS::Service")
+    for service in services.values():
+        awsvpc = service["Properties"]["NetworkConfiguration"]["AwsvpcConfiguration"]
+        # Tasks pull images through their public IP, there is no NAT gateway in dev.
+        assert awsvpc["AssignPublicIp"] == "ENABLED"
+        assert len(awsvpc["Subnets"]) == max_azs
+        for subnet in awsvpc["Subnets"]:
+            assert "PublicSubnet" in subnet["Fn::ImportValue"]
+
+
+def test_scaling_bounds(synthesized):
+    selenium = selenium_config(synthesized)
+    # One per shared service and one per team node service, hubs don't scale.
+    synthesized.compute.resource_count_is(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        service_count(synthesized) + team_count(synthesized),
+    )
+    shared = shared_resources(
+        synthesized,
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {
+            "MinCapacity": selenium["minimum_containers"],
+            "MaxCapacity": selenium["maximum_containers"],
+            "ScalableDimension": "ecs:service:DesiredCount",
+        },
+    )
+    assert len(shared) == service_count(synthesized)
+
+
+def test_scaling_metric_dimensions(synthesized):
+    # Without dimensions the alarm watches a metric that doesn't exist and never fires.
+    alarms = synthesized.compute.find_resources(
+        "AWS::CloudWatch::Alarm", {"Properties": {"Namespace": "AWS/ECS"}}
+    )
+    assert alarms
+    for alarm in alarms.values():
+        dimensions = {d["Name"] for d in alarm["Properties"]["Dimensions"]}
+        assert dimensions == {"ClusterName", "ServiceName"}
+
+
+def test_health_check_timings(synthesized):
+    synthesized.compute.all_resources_properties(
+        "AWS::ElasticLoadBalancingV2::TargetGroup",
+        {
+            "HealthCheckIntervalSeconds": 60,
+            "HealthCheckTimeoutSeconds": 30,
+            "HealthyThresholdCount": 2,
+            "UnhealthyThresholdCount": 5,
+            "TargetType": "ip",
+        },
+    )
+    shared = shared_resources(
+        synthesized,
+        "AWS::ElasticLoadBalancingV2::TargetGroup",
+        {"HealthCheckPath": "/ui"},
+    )
+    assert len(shared) == service_count(synthesized)
+
+
+def test_browser_shm_mount(synthesized):
+    task_definitions = synthesized.compute.find_resources("AWS::ECS::TaskDefinition")
+    browsers = [
+        task_definition["Properties"]
+        for task_definition in task_definitions.values()
+        if not task_definition["Properties"]["ContainerDefinitions"][0]["Image"].startswith(
+            HUB_IMAGE + ":"
+        )
+    ]
+    # Shared services and team nodes run Chrome.
+    assert len(browsers) == service_count(synthesized) + team_count(synthesized)
+    for properties in browsers:
+        assert {"Name": "shm"} in properties["Volumes"]
+        assert {
+            "ContainerPath": "/dev/shm",
+            "SourceVolume": "shm",
+            "ReadOnly": False,
+        } in properties["ContainerDefinitions"][0]["MountPoints"]
@@ -0,0 +1,270 @@
+import copy
+
+import pytest
+from aws_cdk import assertions
+
+
+EC2_OVERRIDES = {
+    "network": {
+        "vpc": {"create_natgateway": 1},
+        "subnets": [
+            {"cidrMask": 21, "name": "Public", "subnetType": "PUBLIC"},
+            {"cidrMask": 22, "name": "Private", "subnetType": "PRIVATE_WITH_EGRESS"},
+        ],
+    },
+    "compute": {
+        "ecs": {
+            "ec2": {
+                "enabled": True,
+                "subnet_group_name": "Private",
+                "instance_types": ["m5.2xlarge", "m5a.2xlarge"],
+                "min_capacity": 0,
+                "max_capacity": 4,
+                "on_demand_base_capacity": 1,
+                "on_demand_percentage_above_base": 25,
+                "target_capacity_percent": 90,
+                "warm_pool": {"min_size": 1, "pool_state": "STOPPED"},
+                "awsvpc_trunking": True,
+            },
+            "selenium": {
+                "ec2_baseline": {
+                    "minimum_containers": 2,
+                    "maximum_containers": 16,
+                    "shm_size": 2048,
+                },
+            },
+        },
+    },
+}
+
+
+@pytest.fixture(scope="module")
+def ec2_synthesized(synthesize_app):
+    return synthesize_app("dev", copy.deepcopy(EC2_OVERRIDES))
+
+
+def test_resource_budget(ec2_synthesized, resource_budget):
+    resources = ec2_synthesized.compute.to_json()["Resources"]
+    assert len(resources) <= resource_budget["compute"]
+
+
+def test_managed_scaling_capacity_provider(ec2_synthesized):
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ECS::CapacityProvider",
+        {
+            "AutoScalingGroupProvider": assertions.Match.object_like(
+                {
+                    "ManagedScaling": assertions.Match.object_like(
+                        {"Status": "ENABLED", "TargetCapacity": 90}
+                    ),
+                    "ManagedTerminationProtection": "ENABLED",
+                }
+            )
+        },
+    )
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ECS::ClusterCapacityProviderAssociations",
+        {
+            "CapacityProviders": assertions.Match.array_with(
+                ["FARGATE", "FARGATE_SPOT"]
+            )
+        },
+    )
+
+
+def test_spot_mix_and_warm_pool(ec2_synthesized):
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::AutoScaling::AutoScalingGroup",
+        {
+            "MaxSize": "4",
+            "MixedInstancesPolicy": assertions.Match.object_like(
+                {
+                    "InstancesDistribution": {
+                        "OnDemandBaseCapacity": 1,
+                        "OnDemandPercentageAboveBaseCapacity": 25,
+                        "SpotAllocationStrategy": "capacity-optimized",
+                    },
+                }
+            ),
+        },
+    )
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::AutoScaling::WarmPool", {"MinSize": 1, "PoolState": "Stopped"}
+    )
+
+
+def test_agent_config(ec2_synthesized):
+    [launch_template] = ec2_synthesized.compute.find_resources(
+        "AWS::EC2::LaunchTemplate"
+    ).values()
+    user_data = launch_template["Properties"]["LaunchTemplateData"]["UserData"]
+    script = "".join(
+        part for part in user_data["Fn::Base64"]["Fn::Join"][1] if isinstance(part, str)
+    )
+    assert "echo ECS_ENABLE_SPOT_INSTANCE_DRAINING=true >> /etc/ecs/ecs.config" in script
+    assert "echo ECS_WARM_POOLS_CHECK=true >> /etc/ecs/ecs.config" in script
+
+
+def test_instances_can_drain_themselves(ec2_synthesized):
+    # Needed by the agent to set a spot instance to DRAINING on an interruption notice.
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": assertions.Match.array_with(
+                    [
+                        assertions.Match.object_like(
+                            {
+                                "Action": "ecs:UpdateContainerInstancesState",
+                                "Effect": "Allow",
+                                "Condition": {
+                                    "ArnEquals": {
+                                        "ecs:cluster": {
+                                            "Fn::GetAtt": [
+                                                assertions.Match.string_like_regexp(
+                                                    "^Ecsselenium"
+                                                ),
+                                                "Arn",
+                                            ]
+                                        }
+                                    }
+                                },
+                            }
+                        )
+                    ]
+                )
+            },
+            "Roles": [
+                {"Ref": assertions.Match.string_like_regexp("^EcsEc2CapacityInstanceRole")}
+            ],
+        },
+    )
+
+
+def test_baseline_service_is_bin_packed(ec2_synthesized):
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ECS::Service",
+        {
+            "PlacementStrategies": [{"Type": "binpack", "Field": "MEMORY"}],
+            "DesiredCount": 2,
+        },
+    )
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {"MinCapacity": 2, "MaxCapacity": 16},
+    )
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ECS::TaskDefinition",
+        {
+            "RequiresCompatibilities": ["EC2"],
+            "ContainerDefinitions": [
+                assertions.Match.object_like(
+                    {"LinuxParameters": {"SharedMemorySize": 2048}}
+                )
+            ],
+        },
+    )
+
+
+def test_fargate_only_bursts(ec2_synthesized):
+    fargate_services = ec2_synthesized.compute.find_resources(
+        "AWS::ECS::Service",
+        {
+            "Properties": {
+                "ServiceName": assertions.Match.string_like_regexp("^Seleniumwebapp-dev"),
+            }
+        },
+    )
+    assert fargate_services
+    for service in fargate_services.values():
+        assert service["Properties"]["DesiredCount"] == 0
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {"MinCapacity": 0, "MaxCapacity": 10},
+    )
+    ec2_synthesized.compute.has_resource_properties(
+        "AWS::ECS::Cluster",
+        {"ClusterSettings": [{"Name": "containerInsights", "Value": "enabled"}]},
+    )
+    # Fargate scales out for the baseline tasks EC2 can't run yet (pending, or not
+    # placed while the ASG is short of spot, at max_capacity or in the warm pool), not
+    # only once the baseline runs all its tasks.
+    shortfall = (
+        "FILL(desired, 0) - FILL(running, 0) + "
+        "IF(FILL(desired, 0) >= 16 AND FILL(ec2_cpu, 0) >= 50, 1, 0)"
+    )
+    scale_out = alarms_on(ec2_synthesized, shortfall, "GreaterThanOrEqualToThreshold")
+    assert len(scale_out) == len(fargate_services)
+    for alarm in scale_out.values():
+        assert alarm["Properties"]["Threshold"] == 1
+    # Fargate tasks hold live sessions, they are only removed when idle and no longer
+    # needed, not as soon as EC2 has room again.
+    scale_in = alarms_on(
+        ec2_synthesized,
+        "IF(FILL(demand, 0) > 0, 100, FILL(cpu, 0))",
+        "LessThanOrEqualToThreshold",
+    )
+    assert len(scale_in) == len(fargate_services)
+
+
+def test_baseline_and_burst_scale_in_do_not_fight(ec2_synthesized):
+    policies = ec2_synthesized.compute.find_resources(
+        "AWS::ApplicationAutoScaling::ScalingPolicy"
+    )
+    for id, policy in policies.items():
+        if not id.startswith("EcsSeleniumwebapp"):
+            continue
+        for step in policy["Properties"]["StepScalingPolicyConfiguration"][
+            "StepAdjustments"
+        ]:
+            if step["ScalingAdjustment"] < 0:
+                # Scale in only below the 10% idle threshold, so Fargate taking part of
+                # the load (EC2 at 10-50% CPU) doesn't shrink the baseline.
+                assert "MetricIntervalLowerBound" not in step
+                assert step["MetricIntervalUpperBound"] == 0
+
+
+def alarms_on(synthesized, expression, comparison_operator):
+    # Alarms of the shared selenium services, team pools have their own.
+    alarms = synthesized.compute.find_resources(
+        "AWS::CloudWatch::Alarm",
+        {
+            "Properties": {
+                "ComparisonOperator": comparison_operator,
+                "Metrics": assertions.Match.array_with(
+                    [assertions.Match.object_like({"Expression": expression})]
+                ),
+            }
+        },
+    )
+    return {id: a for id, a in alarms.items() if id.startswith("Ecs")}
+
+
+def test_baseline_must_fit_task_enis(synthesize_app):
+    overrides = copy.deepcopy(EC2_OVERRIDES)
+    overrides["compute"]["ecs"]["ec2"]["awsvpc_trunking"] = False
+    # 4 instances with 3 task ENIs each can't run 2 baselines of 16 tasks.
+    with pytest.raises(ValueError, match="fits 12 awsvpc tasks"):
+        synthesize_app("dev", overrides)
+
+
+def test_baseline_and_burst_share_target_group(ec2_synthesized):
+    services = ec2_synthesized.compute.find_resources("AWS::ECS::Service")
+    target_groups = {}
+    for service in services.values():
+        # Team pools have no EC2 baseline.
+        if not service["Properties"]["ServiceName"].startswith("Seleniumwebapp"):
+            continue
+        for load_balancer in service["Properties"]["LoadBalancers"]:
+            target_group = load_balancer["TargetGroupArn"]["Ref"]
+            target_groups.setdefault(target_group, []).append(service)
+    assert target_groups
+    for members in target_groups.values():
+        assert len(members) == 2
+
+
+def test_requires_private_subnet(synthesize_app):
+    overrides = copy.deepcopy(EC2_OVERRIDES)
+    overrides["network"]["subnets"] = overrides["network"]["subnets"][:1]
+    with pytest.raises(ValueError, match="private subnet group"):
+        synthesize_app("dev", overrides)
@@ -0,0 +1,43 @@
+from src.network_stack.subnet_planner import SubnetPlanner
+
+
+def test_context_is_cached(synthesized):
+    # Missing lookups would make the synth depend on AWS credentials.
+    assert synthesized.missing_context == []
+
+
+def test_resource_budget(synthesized, resource_budget):
+    resources = synthesized.network.to_json()["Resources"]
+    assert len(resources) <= resource_budget["network"]
+
+
+def test_one_public_subnet_per_az(synthesized):
+    vpc_config = synthesized.config["network"]["vpc"]
+    synthesized.network.resource_count_is("AWS::EC2::Subnet", vpc_config["maxAzs"])
+    synthesized.network.all_resources_properties(
+        "AWS::EC2::Subnet", {"MapPublicIpOnLaunch": True}
+    )
+
+
+def test_task_subnet_fits_fleet(synthesized):
+    planner = SubnetPlanner(synthesized.config)
+    required_ips = planner.required_ips_per_subnet()
+    subnets = synthesized.network.find_resources("AWS::EC2::Subnet")
+    for subnet in subnets.values():
+        cidr_mask = int(subnet["Properties"]["CidrBlock"].split("/")[1])
+        assert 2 ** (32 - cidr_mask) >= required_ips
+
+
+def test_nat_gateways(synthesized):
+    # At most one NAT gateway, it is billed per hour and per GB.
+    expected = synthesized.config["network"]["vpc"]["create_natgateway"]
+    synthesized.network.resource_count_is("AWS::EC2::NatGateway", expected)
+
+
+def test_vpc_parameters_pushed(synthesized):
+    for name in ["vpc", "vpcCidrBlock"]:
+        synthesized.network.has_resource_properties(
+            "AWS::SSM::Parameter",
+            {"Name": synthesized.config["ssm_infra"] + name, "Type": "String"},
+        )
+    synthesized.network.resource_count_is("AWS::SSM::Parameter", 2)
@@ -0,0 +1,214 @@
+import sys
+import types
+
+import pytest
+from aws_cdk import App, Environment, Stack, assertions
+
+from utils.ssm_util import (
+    _FETCH_PARAMETERS_HANDLER,
+    SsmParameterFetcher,
+    SsmParametersFetcher,
+)
+
+PATH = "/selenium/infra/dev/"
+
+
+def fetcher_stack() -> Stack:
+    app = App()
+    stack = Stack(app, "Consumer", env=Environment(account="188775091215", region="us-east-1"))
+    SsmParametersFetcher(
+        stack,
+        "Infra",
+        "us-east-1",
+        PATH,
+        names=["vpc", "vpcCidrBlock"],
+        watch=["vpc", "vpcCidrBlock"],
+    )
+    SsmParametersFetcher(
+        stack, "Remote", "eu-west-3", "/selenium/infra/prod/", names=["vpc"], version="1"
+    )
+    SsmParameterFetcher(stack, "Vpc", "us-east-1", PATH + "vpc")
+    return stack
+
+
+def test_single_lambda_per_stack():
+    template = assertions.Template.from_stack(fetcher_stack())
+    template.resource_count_is("Custom::SsmParametersFetcher", 3)
+    template.resource_count_is("AWS::Lambda::Function", 1)
+    template.has_resource_properties("AWS::Lambda::Function", {"Runtime": "python3.12"})
+
+
+def test_policy_scoped_to_paths():
+    template = assertions.Template.from_stack(fetcher_stack())
+    statements = template.find_resources("AWS::IAM::Policy")
+    # Partition references are dropped from the joined ARNs.
+    resources = [
+        "".join(part if isinstance(part, str) else "" for part in arn["Fn::Join"][1])
+        for policy in statements.values()
+        for statement in policy["Properties"]["PolicyDocument"]["Statement"]
+        for arn in statement["Resource"]
+    ]
+    assert sorted(set(resources)) == sorted(
+        [
+            "arn::ssm:eu-west-3:188775091215:parameter/selenium/infra/prod",
+            "arn::ssm:eu-west-3:188775091215:parameter/selenium/infra/prod/*",
+            "arn::ssm:us-east-1:188775091215:parameter/selenium/infra/dev",
+            "arn::ssm:us-east-1:188775091215:parameter/selenium/infra/dev/*",
+        ]
+    )
+
+
+def test_properties_stable_across_synths():
+    # A deploy only calls the Lambda when these properties change.
+    first = assertions.Template.from_stack(fetcher_stack()).find_resources(
+        "Custom::SsmParametersFetcher"
+    )
+    second = assertions.Template.from_stack(fetcher_stack()).find_resources(
+        "Custom::SsmParametersFetcher"
+    )
+    assert first == second
+
+
+def test_watched_parameters_resolved_by_cloudformation():
+    template = assertions.Template.from_stack(fetcher_stack())
+    parameters = template.to_json()["Parameters"]
+    watched = sorted(
+        p["Default"]
+        for p in parameters.values()
+        if p["Type"] == "AWS::SSM::Parameter::Value<String>"
+        and p["Default"].startswith(PATH)
+    )
+    assert watched == [PATH + "vpc", PATH + "vpcCidrBlock"]
+    template.has_resource_properties(
+        "Custom::SsmParametersFetcher",
+        {
+            "Path": PATH,
+            "Names": ["vpc", "vpcCidrBlock"],
+            "Watched": {
+                "vpc": {"Ref": assertions.Match.any_value()},
+                "vpcCidrBlock": {"Ref": assertions.Match.any_value()},
+            },
+        },
+    )
+
+
+def test_single_parameter_fetcher_not_watched_by_default():
+    # The parameter may be a SecureString, which CloudFormation can't resolve.
+    stack = Stack(App(), "Consumer", env=Environment(region="us-east-1"))
+    SsmParameterFetcher(stack, "Token", "us-east-1", PATH + "token")
+    template = assertions.Template.from_stack(stack)
+    assert not [
+        p
+        for p in template.to_json()["Parameters"].values()
+        if p["Default"].startswith(PATH)
+    ]
+    template.has_resource_properties(
+        "Custom::SsmParametersFetcher",
+        {"Names": ["token"], "Version": "1", "Watched": {}},
+    )
+
+
+def test_single_parameter_fetcher_opt_in_watch():
+    stack = Stack(App(), "Consumer", env=Environment(region="us-east-1"))
+    SsmParameterFetcher(stack, "Vpc", "us-east-1", PATH + "vpc", watch=True)
+    template = assertions.Template.from_stack(stack)
+    template.has_resource_properties(
+        "Custom::SsmParametersFetcher",
+        {"Watched": {"vpc": {"Ref": assertions.Match.any_value()}}},
+    )
+
+
+def test_refresh_signal_required():
+    stack = Stack(App(), "Consumer", env=Environment(region="us-east-1"))
+    with pytest.raises(ValueError, match="needs `watch` or `version`"):
+        SsmParametersFetcher(stack, "Infra", "us-east-1", PATH, names=["vpc"])
+
+
+def test_cross_region_watch_rejected():
+    stack = Stack(App(), "Consumer", env=Environment(region="us-east-1"))
+    with pytest.raises(ValueError, match="can only watch parameters of the stack region"):
+        SsmParametersFetcher(
+            stack, "Infra", "eu-west-3", PATH, names=["vpc"], watch=["vpc"]
+        )
+
+
+def test_only_fetched_names_readable():
+    stack = Stack(App(), "Consumer", env=Environment(region="us-east-1"))
+    fetcher = SsmParametersFetcher(stack, "Infra", "us-east-1", PATH, names=["vpc"], version="1")
+    fetcher.get_string("vpc")
+    fetcher.get_version("vpc")
+    with pytest.raises(ValueError, match="'vpcCidrBlock' is not one of the fetched names"):
+        fetcher.get_string("vpcCidrBlock")
+
+
+def run_handler(monkeypatch, parameters, names):
+    responses = []
+    client = types.SimpleNamespace(
+        get_paginator=lambda _: types.SimpleNamespace(
+            paginate=lambda **_: [{"Parameters": parameters}]
+        )
+    )
+    monkeypatch.setitem(
+        sys.modules, "boto3", types.SimpleNamespace(client=lambda *_, **__: client)
+    )
+    monkeypatch.setitem(
+        sys.modules,
+        "cfnresponse",
+        types.SimpleNamespace(
+            SUCCESS="SUCCESS",
+            FAILED="FAILED",
+            send=lambda *args, **kwargs: responses.append((args, kwargs)),
+        ),
+    )
+    namespace = {}
+    exec(_FETCH_PARAMETERS_HANDLER, namespace)
+    event = {
+        "RequestType": "Create",
+        "StackId": "stack",
+        "RequestId": "request",
+        "LogicalResourceId": "Infra",
+        "ResourceProperties": {
+            "Path": PATH,
+            "Region": "us-east-1",
+            "Names": names,
+            "Version": "1",
+        },
+    }
+    namespace["handler"](event, types.SimpleNamespace(log_stream_name="stream"))
+    [(args, kwargs)] = responses
+    return args[2], args[3], kwargs
+
+
+def parameter(name, value="value", type="String"):
+    return {"Name": PATH + name, "Value": value, "Version": 3, "Type": type}
+
+
+def test_handler_returns_requested_names(monkeypatch):
+    status, data, kwargs = run_handler(
+        monkeypatch, [parameter("vpc"), parameter("other")], ["vpc"]
+    )
+    assert status == "SUCCESS"
+    assert data == {"vpc": "value", "vpc.version": "3"}
+    assert kwargs["noEcho"] is False
+
+
+def test_handler_hides_secure_strings(monkeypatch):
+    _, _, kwargs = run_handler(
+        monkeypatch, [parameter("token", type="SecureString")], ["token"]
+    )
+    assert kwargs["noEcho"] is True
+
+
+def test_handler_fails_missing_names(monkeypatch):
+    status, _, kwargs = run_handler(monkeypatch, [parameter("vpc")], ["vpc", "subnets"])
+    assert status == "FAILED"
+    assert "['subnets']" in kwargs["reason"]
+
+
+def test_handler_fails_oversized_response(monkeypatch):
+    parameters = [parameter(f"p{i}", "x" * 500) for i in range(10)]
+    status, _, kwargs = run_handler(
+        monkeypatch, parameters, [p["Name"][len(PATH):] for p in parameters]
+    )
+    assert status == "FAILED"
+    assert "exceeds the 4096 bytes" in kwargs["reason"]
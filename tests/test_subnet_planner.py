@@ -0,0 +1,101 @@
+import pytest
+from aws_cdk import App, Environment, Stack, assertions
+
+from src.compute_stack.team_pools import max_team_tasks
+from src.network_stack.subnet_planner import SubnetPlanner
+from src.network_stack.vpc import Vpc
+
+
+def planner_config(cidr_mask=21, cidr="10.50.0.0/16", maximum_containers=10):
+    subnet = {"name": "Public", "subnetType": "PUBLIC"}
+    if cidr_mask is not None:
+        subnet["cidrMask"] = cidr_mask
+    return {
+        "name": "seleniumCloud",
+        "network": {
+            "vpc": {"cidr": cidr, "maxAzs": 3, "create_natgateway": 0},
+            "subnets": [subnet],
+        },
+        "compute": {
+            "ecs": {
+                "selenium": {
+                    "service_count": 1,
+                    "maximum_containers": maximum_containers,
+                }
+            }
+        },
+    }
+
+
+def test_required_ips():
+    # 10 tasks * 2 surge over 2 surviving AZs + 1 ALB + AWS reserved.
+    assert SubnetPlanner(planner_config()).required_ips_per_subnet() == 10 + 8 + 5
+
+
+def test_dedicated_team_pools_counted():
+    config = planner_config()
+    config["compute"]["ecs"]["teams"] = [
+        {"name": "qa", "mode": "dedicated", "maximum_containers": 5},
+        {"name": "web", "mode": "shared"},
+    ]
+    # The qa nodes and hub are added to the 10 shared tasks, with a second ALB.
+    assert SubnetPlanner(config).max_task_count() == 10 + max_team_tasks(
+        config["compute"]["ecs"]["teams"][0]
+    )
+    assert SubnetPlanner(config).load_balancer_count() == 2
+
+
+def test_invalid_team_mode_rejected():
+    config = planner_config()
+    config["compute"]["ecs"]["teams"] = [{"name": "qa", "mode": "private"}]
+    with pytest.raises(ValueError, match="mode must be one of"):
+        SubnetPlanner(config).plan()
+
+
+def test_configured_mask_kept():
+    subnets = SubnetPlanner(planner_config(cidr_mask=21)).plan()
+    assert [subnet.cidr_mask for subnet in subnets] == [21]
+
+
+def test_mask_picked_when_missing():
+    # 23 IPs fit in a /27.
+    subnets = SubnetPlanner(planner_config(cidr_mask=None)).plan()
+    assert [subnet.cidr_mask for subnet in subnets] == [27]
+
+
+def test_configured_mask_too_small():
+    with pytest.raises(ValueError, match="/28 holds 16 IPs but 23 are needed"):
+        SubnetPlanner(planner_config(cidr_mask=28)).plan()
+
+
+def test_unsized_subnet_needs_mask():
+    config = planner_config()
+    config["network"]["subnets"].append({"name": "Isolated", "subnetType": "PRIVATE_ISOLATED"})
+    with pytest.raises(ValueError, match="'Isolated' needs a cidrMask"):
+        SubnetPlanner(config).plan()
+
+
+def test_vpc_cidr_overflow():
+    # Three /21 subnets don't fit in a /22.
+    with pytest.raises(ValueError, match="VPC 10.50.0.0/22 has 1024 addresses"):
+        SubnetPlanner(planner_config(cidr="10.50.0.0/22")).plan()
+
+
+def test_fleet_larger_than_biggest_subnet():
+    with pytest.raises(ValueError, match="exceed the largest subnet size"):
+        SubnetPlanner(planner_config(cidr_mask=None, maximum_containers=100000)).plan()
+
+
+def test_vpcs_do_not_share_subnets():
+    # Regression: the subnet configuration used to be a class-level list.
+    app = App()
+    stacks = []
+    for region in ["us-east-1", "eu-west-3"]:
+        stack = Stack(app, "Network-" + region, env=Environment(region=region))
+        Vpc(stack, "Vpc", planner_config())
+        stacks.append(stack)
+    for stack in stacks:
+        # One Public subnet per AZ, not one per Vpc built so far.
+        assertions.Template.from_stack(stack).resource_count_is(
+            "AWS::EC2::Subnet", len(stack.availability_zones)
+        )
@@ -0,0 +1,278 @@
+import pytest
+from aws_cdk import assertions
+
+from src.compute_stack.team_pools import dedicated_teams
+
+
+@pytest.fixture
+def teams(synthesized):
+    teams = dedicated_teams(synthesized.config)
+    if not teams:
+        pytest.skip("no dedicated teams in this stage")
+    return teams
+
+
+def team_resources(synthesized, type, props):
+    resources = synthesized.compute.find_resources(type, {"Properties": props})
+    return {id: r for id, r in resources.items() if id.startswith("TeamPools")}
+
+
+def test_team_quota(synthesized, teams):
+    targets = team_resources(
+        synthesized, "AWS::ApplicationAutoScaling::ScalableTarget", {}
+    )
+    # Only the node services scale, one scalable target per team.
+    assert len(targets) == len(teams)
+    for team in teams:
+        matching = team_resources(
+            synthesized,
+            "AWS::ApplicationAutoScaling::ScalableTarget",
+            {
+                "MinCapacity": team["minimum_containers"],
+                "MaxCapacity": team["maximum_containers"],
+            },
+        )
+        assert len(matching) == 1
+        [target] = matching.values()
+        [service] = [
+            part["Fn::GetAtt"]
+            for part in target["Properties"]["ResourceId"]["Fn::Join"][1]
+            if isinstance(part, dict) and "Fn::GetAtt" in part
+        ]
+        assert service[0].startswith("TeamPoolsnodeservice" + team["name"])
+
+
+def queue_alarms(synthesized):
+    return synthesized.compute.find_resources(
+        "AWS::CloudWatch::Alarm",
+        {
+            "Properties": {
+                "Metrics": assertions.Match.array_with(
+                    [
+                        assertions.Match.object_like(
+                            {
+                                "Expression": assertions.Match.string_like_regexp(
+                                    r"^IF\(FILL\(nodes, 0\) < 1 OR"
+                                )
+                            }
+                        )
+                    ]
+                ),
+                "ComparisonOperator": "GreaterThanOrEqualToThreshold",
+            }
+        },
+    )
+
+
+def test_nodes_scale_on_queue(synthesized, teams):
+    alarms = queue_alarms(synthesized)
+    assert len(alarms) == len(teams)
+    for alarm in alarms.values():
+        metrics = {m["Id"]: m for m in alarm["Properties"]["Metrics"]}
+        # Published by the hub's target group, so it exists without nodes.
+        assert metrics["requests"]["MetricStat"]["Metric"]["Namespace"] == "AWS/ApplicationELB"
+        assert metrics["requests"]["MetricStat"]["Metric"]["MetricName"] == "RequestCount"
+        assert metrics["nodes"]["MetricStat"]["Metric"]["MetricName"] == "RunningTaskCount"
+    synthesized.compute.has_resource_properties(
+        "AWS::ECS::Cluster",
+        {"ClusterSettings": [{"Name": "containerInsights", "Value": "enabled"}]},
+    )
+
+
+def test_team_without_nodes_scales_out(synthesize_app):
+    overrides = {
+        "compute": {
+            "ecs": {
+                "teams": [
+                    {
+                        "name": "nightly",
+                        "mode": "dedicated",
+                        "priority": 3,
+                        "minimum_containers": 0,
+                        "maximum_containers": 3,
+                    }
+                ]
+            }
+        }
+    }
+    synthesized = synthesize_app("dev", overrides)
+    synthesized.compute.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {"MinCapacity": 0, "MaxCapacity": 3},
+    )
+    [alarm] = queue_alarms(synthesized).values()
+    # A single new session request at 0 nodes adds one.
+    assert alarm["Properties"]["Threshold"] == 1
+    assert alarm["Properties"]["EvaluationPeriods"] == 1
+
+
+def test_team_hub(synthesized, teams):
+    for team in teams:
+        name = team["name"]
+        synthesized.compute.has_resource_properties(
+            "AWS::ECS::TaskDefinition",
+            {
+                "ContainerDefinitions": [
+                    assertions.Match.object_like(
+                        {
+                            "Image": assertions.Match.string_like_regexp("^selenium/hub:"),
+                            "Environment": assertions.Match.array_with(
+                                [{"Name": "SE_SUB_PATH", "Value": "/" + name}]
+                            ),
+                        }
+                    )
+                ]
+            },
+        )
+        # Nodes register with their team hub, not with each other.
+        synthesized.compute.has_resource_properties(
+            "AWS::ECS::TaskDefinition",
+            {
+                "ContainerDefinitions": [
+                    assertions.Match.object_like(
+                        {
+                            "Image": assertions.Match.string_like_regexp(
+                                "^selenium/node-chrome:"
+                            ),
+                            "Environment": assertions.Match.array_with(
+                                [
+                                    {
+                                        "Name": "SE_EVENT_BUS_HOST",
+                                        "Value": f"{name}-hub.selenium-teams-"
+                                        + synthesized.config["stage"]
+                                        + ".local",
+                                    }
+                                ]
+                            ),
+                        }
+                    )
+                ]
+            },
+        )
+        hubs = team_resources(
+            synthesized,
+            "AWS::ECS::Service",
+            {"ServiceName": f"Selenium-{synthesized.config['stage']}-{name}-hub"},
+        )
+        assert len(hubs) == 1
+        assert next(iter(hubs.values()))["Properties"]["DesiredCount"] == 1
+
+
+def test_team_health_checks(synthesized, teams):
+    for team in teams:
+        target_groups = team_resources(
+            synthesized,
+            "AWS::ElasticLoadBalancingV2::TargetGroup",
+            {"HealthCheckPath": f"/{team['name']}/status"},
+        )
+        # New session and grid target groups, both on the team hub.
+        assert len(target_groups) == 2
+
+
+def test_idle_timeout_covers_queued_sessions(synthesized, teams):
+    synthesized.compute.has_resource_properties(
+        "AWS::ElasticLoadBalancingV2::LoadBalancer",
+        {
+            "LoadBalancerAttributes": assertions.Match.array_with(
+                [{"Key": "idle_timeout.timeout_seconds", "Value": "310"}]
+            )
+        },
+    )
+
+
+def test_new_sessions_routed_per_team(synthesized, teams):
+    for team in teams:
+        synthesized.compute.has_resource_properties(
+            "AWS::ElasticLoadBalancingV2::ListenerRule",
+            {
+                "Conditions": assertions.Match.array_with(
+                    [
+                        {
+                            "Field": "path-pattern",
+                            "PathPatternConfig": {"Values": [f"/{team['name']}/session"]},
+                        },
+                        {
+                            "Field": "http-request-method",
+                            "HttpRequestMethodConfig": {"Values": ["POST"]},
+                        },
+                    ]
+                )
+            },
+        )
+    # One rule for new sessions and one for the rest of the grid per team.
+    synthesized.compute.resource_count_is(
+        "AWS::ElasticLoadBalancingV2::ListenerRule", 2 * len(teams)
+    )
+
+
+def team_overrides(*teams):
+    return {
+        "compute": {
+            "ecs": {
+                "teams": [
+                    {
+                        "name": name,
+                        "mode": "dedicated",
+                        "minimum_containers": 1,
+                        "maximum_containers": 2,
+                        **({"priority": priority} if priority is not None else {}),
+                    }
+                    for name, priority in teams
+                ]
+            }
+        }
+    }
+
+
+def rule_priorities(synthesized):
+    rules = synthesized.compute.find_resources("AWS::ElasticLoadBalancingV2::ListenerRule")
+    return {
+        rule["Properties"]["Conditions"][0]["PathPatternConfig"]["Values"][0]: rule[
+            "Properties"
+        ]["Priority"]
+        for rule in rules.values()
+    }
+
+
+def test_rule_priorities_stable_across_team_order(synthesize_app):
+    first = synthesize_app("dev", team_overrides(("qa", 0), ("mobile", 7)))
+    # Removing a team and adding another before it keeps the priorities.
+    second = synthesize_app("dev", team_overrides(("ops", 2), ("mobile", 7)))
+    assert rule_priorities(first)["/mobile/session"] == 71
+    assert rule_priorities(second)["/mobile/session"] == 71
+    assert rule_priorities(second)["/mobile/*"] == 72
+    assert rule_priorities(second)["/ops/session"] == 21
+
+
+def test_team_priority_required(synthesize_app):
+    with pytest.raises(ValueError, match="'qa' needs a priority"):
+        synthesize_app("dev", team_overrides(("qa", None)))
+
+
+def test_team_priorities_unique(synthesize_app):
+    with pytest.raises(ValueError, match="'qa' and 'mobile' have the same priority 1"):
+        synthesize_app("dev", team_overrides(("qa", 1), ("mobile", 1)))
+
+
+def test_unknown_team_rejected(synthesized, teams):
+    synthesized.compute.has_resource_properties(
+        "AWS::ElasticLoadBalancingV2::Listener",
+        {
+            "DefaultActions": [
+                assertions.Match.object_like(
+                    {"FixedResponseConfig": assertions.Match.object_like({"StatusCode": "404"})}
+                )
+            ]
+        },
+    )
+
+
+def test_queue_wait_slo_alarm(synthesized, teams):
+    slo_teams = [team for team in teams if team.get("queue_wait_slo_seconds") is not None]
+    alarms = synthesized.compute.find_resources(
+        "AWS::CloudWatch::Alarm",
+        {"Properties": {"MetricName": "TargetResponseTime", "ExtendedStatistic": "p95"}},
+    )
+    assert sorted(a["Properties"]["Threshold"] for a in alarms.values()) == sorted(
+        team["queue_wait_slo_seconds"] for team in slo_teams
+    )
@@ -1,35 +1,223 @@
-from aws_cdk.custom_resources import AwsCustomResource,AwsSdkCall,AwsCustomResourcePolicy,PhysicalResourceId
-from aws_cdk import aws_iam
-from constructs import Construct 
-import datetime 
-
-class SsmParameterFetcher(AwsCustomResource):
-    def __init__(self, scope: Construct, id: str, region: str, parameter_name: str, *args, **kwargs):
-        ssmAwsCall=AwsSdkCall(
-            service='SSM',
-            action= 'getParameter',
-            parameters= {
-                "Name": parameter_name,
-                "WithDecryption": True
+from typing import List, Optional
+
+from aws_cdk import aws_iam, aws_lambda, aws_ssm
+from aws_cdk import CustomResource, Duration, Fn, Stack, Token
+from constructs import Construct
+
+# Handler of SsmParametersFetcher. One paginated getParametersByPath per create/update,
+# returning the requested parameters keyed by their name relative to the path (e.g.
+# "vpc", "vpcCidrBlock" for the parameters pushed by NetworkStack).
+_FETCH_PARAMETERS_HANDLER = """
+import json
+
+import boto3
+import cfnresponse
+
+# CloudFormation rejects custom resource responses larger than this.
+MAX_RESPONSE_BYTES = 4096
+
+
+def handler(event, context):
+    props = event["ResourceProperties"]
+    physical_id = props["Path"] + "@" + props["Version"]
+    try:
+        data = {}
+        secure = False
+        if event["RequestType"] != "Delete":
+            path = props["Path"].rstrip("/")
+            names = set(props["Names"])
+            ssm = boto3.client("ssm", region_name=props["Region"])
+            pages = ssm.get_paginator("get_parameters_by_path").paginate(
+                Path=path, WithDecryption=True
+            )
+            for page in pages:
+                for parameter in page["Parameters"]:
+                    name = parameter["Name"][len(path) + 1:]
+                    if name not in names:
+                        continue
+                    data[name] = parameter["Value"]
+                    data[name + ".version"] = str(parameter["Version"])
+                    secure = secure or parameter["Type"] == "SecureString"
+            missing = sorted(names - set(data))
+            if missing:
+                raise ValueError(f"Parameters not found under {path}: {missing}")
+            # Same body as cfnresponse.send.
+            body = json.dumps(
+                {
+                    "Status": cfnresponse.SUCCESS,
+                    "Reason": "See the details in CloudWatch Log Stream: "
+                    + context.log_stream_name,
+                    "PhysicalResourceId": physical_id,
+                    "StackId": event["StackId"],
+                    "RequestId": event["RequestId"],
+                    "LogicalResourceId": event["LogicalResourceId"],
+                    "NoEcho": secure,
+                    "Data": data,
+                }
+            )
+            if len(body) > MAX_RESPONSE_BYTES:
+                raise ValueError(
+                    f"Response of {len(body)} bytes exceeds the {MAX_RESPONSE_BYTES} "
+                    "bytes CloudFormation accepts, split the parameters over fetchers."
+                )
+        # Keep decrypted SecureString values out of the stack events and outputs.
+        cfnresponse.send(
+            event, context, cfnresponse.SUCCESS, data, physical_id, noEcho=secure
+        )
+    except Exception as e:
+        print(e)
+        cfnresponse.send(
+            event, context, cfnresponse.FAILED, {}, physical_id, reason=str(e)
+        )
+"""
+
+
+class SsmParametersFetcher(Construct):
+    """Reads the SSM parameters `names` under a path (e.g. config["ssm_infra"]) in one batch.
+
+    Only the requested parameters are returned, and their values plus versions
+    must fit in the 4096 bytes of a custom resource response: the deploy fails
+    with the response size otherwise. SecureString values are decrypted and sent
+    back with noEcho. The values are fetched on create and then only when a resource property
+    changes, so a deploy that doesn't touch them costs no Lambda call:
+    - `watch` lists parameters (relative to `path`) whose value is a refresh
+      signal. They are passed in as SSM parameter typed stack parameters, which
+      CloudFormation resolves on every deploy without a Lambda call, so a new
+      value updates the fetcher. Same region as the stack and String or
+      StringList parameters only, CloudFormation can't resolve SecureStrings.
+    - `version` is bumped by hand, for cross-region paths or parameters that
+      aren't watched.
+    One of them must be given, otherwise the fetched values would never refresh.
+    All fetchers of a stack share a single Lambda function.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        region: str,
+        path: str,
+        names: List[str],
+        watch: Optional[List[str]] = None,
+        version: Optional[str] = None,
+    ):
+        super().__init__(scope, id)
+
+        stack = Stack.of(self)
+        if not names:
+            raise ValueError(f"SsmParametersFetcher '{id}' needs the `names` to fetch.")
+        if not watch and version is None:
+            raise ValueError(
+                f"SsmParametersFetcher '{id}' needs `watch` or `version` to know "
+                "when to fetch the parameters again."
+            )
+        if watch and not Token.is_unresolved(stack.region) and stack.region != region:
+            raise ValueError(
+                f"SsmParametersFetcher '{id}' can only watch parameters of the stack "
+                f"region ({stack.region}), use `version` for {region}."
+            )
+
+        handler = aws_lambda.SingletonFunction(
+            self,
+            "Handler",
+            uuid="5d0bd3e4-6c4c-4c52-9a0c-7f1e3b2a9d41",
+            lambda_purpose="SsmParametersFetcher",
+            runtime=aws_lambda.Runtime(
+                "python3.12", aws_lambda.RuntimeFamily.PYTHON, supports_inline_code=True
+            ),
+            handler="index.handler",
+            code=aws_lambda.Code.from_inline(_FETCH_PARAMETERS_HANDLER),
+            timeout=Duration.minutes(1),
+        )
+        handler.add_to_role_policy(
+            aws_iam.PolicyStatement(
+                actions=["ssm:GetParametersByPath"],
+                resources=[
+                    stack.format_arn(
+                        service="ssm",
+                        region=region,
+                        resource="parameter",
+                        resource_name=path.strip("/"),
+                    ),
+                    stack.format_arn(
+                        service="ssm",
+                        region=region,
+                        resource="parameter",
+                        resource_name=path.strip("/") + "/*",
+                    ),
+                ],
+                effect=aws_iam.Effect.ALLOW,
+            )
+        )
+
+        self._names = list(names)
+        self._resource = CustomResource(
+            self,
+            "Parameters",
+            service_token=handler.function_arn,
+            resource_type="Custom::SsmParametersFetcher",
+            properties={
+                "Path": path,
+                "Region": region,
+                "Names": self._names,
+                "Version": version or "watch",
+                "Watched": {
+                    name: aws_ssm.StringParameter.value_for_string_parameter(
+                        self, path + name
+                    )
+                    for name in watch or []
+                },
             },
-            region=region,
-            physical_resource_id=PhysicalResourceId.of( str(datetime.datetime.now())) # Update physical id to always fetch the latest version}
         )
 
+    def get_string(self, name: str) -> str:
+        return self._resource.get_att_string(self.__attribute(name))
+
+    def get_string_list(self, name: str) -> List[str]:
+        return Fn.split(",", self.get_string(name))
+
+    def get_number(self, name: str) -> float:
+        return Token.as_number(self._resource.get_att(self.__attribute(name)))
+
+    def get_version(self, name: str) -> str:
+        return self._resource.get_att_string(self.__attribute(name) + ".version")
+
+    def __attribute(self, name: str) -> str:
+        # Only the requested names are in the response.
+        if name not in self._names:
+            raise ValueError(f"'{name}' is not one of the fetched names {self._names}.")
+        return name
+
+
+class SsmParameterFetcher(SsmParametersFetcher):
+    """Reads a single SSM parameter, kept for the existing callers.
+
+    Built on SsmParametersFetcher. Like before, the parameter is read with
+    decryption, so it may be a SecureString: it is never watched (CloudFormation
+    can't resolve SecureStrings as stack parameters) and is fetched again when
+    `version` changes. Pass `watch=True` to refresh on every new value of a
+    String parameter of the stack region instead.
+    """
+
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        region: str,
+        parameter_name: str,
+        version: str = "1",
+        watch: bool = False,
+    ):
+        path, self._name = parameter_name.rsplit("/", 1)
         super().__init__(
-            scope, 
+            scope,
             id,
-            on_update=ssmAwsCall,
-            policy=AwsCustomResourcePolicy.from_statements([
-                aws_iam.PolicyStatement(
-                    resources= ['*'],
-                    actions= ['ssm:GetParameter'],
-                    effect= aws_iam.Effect.ALLOW
-                    )
-                ]),
-            *args,
-            **kwargs)
+            region=region,
+            path=path + "/",
+            names=[self._name],
+            watch=[self._name] if watch else None,
+            version=version,
+        )
 
-    
     def get_parameter(self):
-        return self.get_response_field('Parameter.Value')
\ No newline at end of file
+        return self.get_string(self._name)